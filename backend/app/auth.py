@@ -1,21 +1,107 @@
-import os, datetime as dt
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher, Type
+from argon2.exceptions import VerifyMismatchError, InvalidHashError
+from argon2.low_level import hash_secret_raw
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from jose import jwt, JWTError
-from passlib.context import CryptContext
+import jwt
 
 load_dotenv()
+logger = logging.getLogger("crm.auth")
+
 JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
 ALGO = os.getenv("JWT_ALGORITHM", "HS256")
 ISSUER = os.getenv("JWT_ISSUER", None)
 ACCESS_MIN = int(os.getenv("ACCESS_TOKEN_MINUTES", "60"))
 
-pwd = CryptContext(schemes=["argon2"], deprecated="auto")
+# Verified-token cache: clients reuse the same bearer token for its whole lifetime,
+# so repeat verifications collapse into a dict lookup keyed by the token's SHA-256.
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+JWT_CACHE_TTL = int(os.getenv("JWT_CACHE_TTL", "30"))  # seconds
+_token_cache: TTLCache = TTLCache(maxsize=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL)
+_token_cache_lock = threading.Lock()
+
+# Argon2id cost knobs (tunable via env so ops can dial cost per deployment).
+# Defaults follow the OWASP m=46 MiB / t=1 / p=1 recommendation. Raising
+# ARGON2_PARALLELISM above 1 lets libargon2's SIMD (opt.c) backend fill lanes
+# on multiple cores for a single hash.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "1"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", str(46 * 1024)))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+_ph = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+    type=Type.ID,
+)
 
+# Argon2 is CPU-bound and argon2-cffi releases the GIL inside the C code, so a small
+# dedicated pool (sized to the cores) runs the async routes' hashes in parallel without
+# letting a burst of logins starve the request threadpool or block the event loop.
+ARGON2_WORKERS = int(os.getenv("ARGON2_WORKERS", str(os.cpu_count() or 1)))
+_argon_pool = ThreadPoolExecutor(max_workers=ARGON2_WORKERS, thread_name_prefix="argon2")
+
+# Sync callers (manage, seed script) hash on their own thread: handing the work to
+# the pool would only park this thread while another one runs it.
 def hash_password(pw: str) -> str:
-    return pwd.hash(pw)
+    return _ph.hash(pw)
 
 def verify_password(pw: str, pw_hash: str) -> bool:
-    return pwd.verify(pw, pw_hash)
+    try:
+        return _ph.verify(pw_hash, pw)
+    except (VerifyMismatchError, InvalidHashError):
+        return False
+
+ARGON2_SLOW_MS = float(os.getenv("ARGON2_SLOW_MS", "25"))
+
+def _argon2_self_test() -> None:
+    """
+    Time one small Argon2id hash (t=1, m=8 MiB, p=1) and warn when libargon2 looks
+    like the portable reference build rather than the SIMD-optimized one.
+    """
+    t0 = time.perf_counter()
+    hash_secret_raw(b"x" * 1024, b"crm-self-test-salt", time_cost=1, memory_cost=8 * 1024,
+                    parallelism=1, hash_len=32, type=Type.ID)
+    ms = (time.perf_counter() - t0) * 1000
+    logger.info("Argon2 self-test: %.1f ms (t=1, m=8MiB, p=1)", ms)
+    if ms > ARGON2_SLOW_MS:
+        logger.warning(
+            "Argon2 self-test took %.1f ms (> %.0f ms); libargon2 is probably the reference build. "
+            "Rebuild with `apt-get install libargon2-dev` and "
+            "`ARGON2_CFFI_USE_SYSTEM=1 CFLAGS=\"-march=native -O3\" pip install --no-binary argon2-cffi-bindings argon2-cffi-bindings` "
+            "to get the SSE2/AVX2 backend.",
+            ms, ARGON2_SLOW_MS,
+        )
+
+if os.getenv("ARGON2_SELF_TEST", "true").lower() in {"1", "true", "yes", "on"}:
+    _argon2_self_test()
+
+async def ahash_password(pw: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_argon_pool, hash_password, pw)
+
+async def averify_password(pw: str, pw_hash: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_argon_pool, verify_password, pw, pw_hash)
+
+def password_needs_rehash(pw_hash: str) -> bool:
+    """True when a stored hash was made with other parameters than the current ones."""
+    try:
+        return _ph.check_needs_rehash(pw_hash)
+    except InvalidHashError:
+        return False
+
+# Claims that never change between tokens are built once; exp/iat are plain
+# epoch ints so no datetime objects are allocated per token.
+_ACCESS_SECONDS = ACCESS_MIN * 60
+_BASE_CLAIMS = {"type": "access", **({"iss": ISSUER} if ISSUER else {})}
+_ADMIN_CLAIMS = {"is_admin": True, "role": "admin"}
+_USER_CLAIMS = {"is_admin": False, "role": "user"}
 
 def create_access_token(sub: str | int, is_admin: bool | None = None, extra: dict | None = None) -> str:
     """Create a signed JWT access token.
@@ -23,25 +109,32 @@ def create_access_token(sub: str | int, is_admin: bool | None = None, extra: dic
     - `is_admin`: include admin claim if provided
     - `extra`: optional extra claims to merge into the payload
     """
-    now = dt.datetime.now(dt.timezone.utc)
-    payload: dict = {
-        "sub": str(sub),
-        "type": "access",
-        "iat": now,
-        "exp": now + dt.timedelta(minutes=ACCESS_MIN),
-    }
-    if ISSUER:
-        payload["iss"] = ISSUER
+    iat = int(time.time())
+    payload: dict = {**_BASE_CLAIMS, "sub": str(sub), "iat": iat, "exp": iat + _ACCESS_SECONDS}
     if is_admin is not None:
-        payload["is_admin"] = bool(is_admin)
-        payload["role"] = "admin" if is_admin else "user"
+        payload.update(_ADMIN_CLAIMS if is_admin else _USER_CLAIMS)
     if extra:
         payload.update(extra)
     return jwt.encode(payload, JWT_SECRET, algorithm=ALGO)
 
 def decode_token(token: str) -> dict:
-    try:
-        return jwt.decode(token, JWT_SECRET, algorithms=[ALGO])
-    except JWTError as e:
-        # Re-raise to let routers convert to 401/403 uniformly
-        raise e
\ No newline at end of file
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    with _token_cache_lock:
+        hit = _token_cache.get(key)
+    if hit is not None:
+        payload, expires_at = hit
+        # Never serve a token past its own `exp`, even if the cache TTL is longer
+        if now < expires_at:
+            return payload
+
+    # PyJWTError propagates for routers to convert to 401/403 (errors are never cached)
+    payload = jwt.decode(
+        token, JWT_SECRET, algorithms=[ALGO], options={"require": ["exp", "sub", "iat"]}
+    )
+
+    exp = payload.get("exp")
+    expires_at = min(now + JWT_CACHE_TTL, float(exp)) if exp is not None else now + JWT_CACHE_TTL
+    with _token_cache_lock:
+        _token_cache[key] = (payload, expires_at)
+    return payload
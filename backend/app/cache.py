@@ -0,0 +1,79 @@
+"""
+Optional Redis cache for expensive read payloads (currently the dashboard).
+
+Disabled unless REDIS_URL is set. Every operation fails open: a Redis outage
+degrades to recomputing the payload, never to a failed request.
+"""
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger("crm.cache")
+
+REDIS_URL = os.getenv("REDIS_URL")
+DASHBOARD_TTL_USER = int(os.getenv("DASHBOARD_CACHE_TTL", "60"))  # seconds
+DASHBOARD_TTL_ADMIN = int(os.getenv("DASHBOARD_CACHE_TTL_ADMIN", "15"))  # seconds
+
+_redis = None
+_aredis = None
+if REDIS_URL:
+    try:
+        import redis
+        import redis.asyncio
+
+        _redis = redis.Redis.from_url(REDIS_URL, socket_timeout=0.25, socket_connect_timeout=0.25)
+        _aredis = redis.asyncio.Redis.from_url(REDIS_URL, socket_timeout=0.25, socket_connect_timeout=0.25)
+    except ImportError:
+        logger.warning("REDIS_URL is set but the redis package is not installed; caching disabled.")
+
+
+def _dashboard_key(user_id: int, is_admin: bool) -> str:
+    # Admin dashboards are global (not per-user), so all admins share one entry
+    return "dashboard:admin:1" if is_admin else f"dashboard:{user_id}:0"
+
+
+def _dashboard_keys_for_owner(owner_id: int) -> tuple:
+    """Entries that include data owned by `owner_id`: the owner's own view and the admin view."""
+    return (f"dashboard:{owner_id}:0", "dashboard:admin:1")
+
+
+async def aget_dashboard(user_id: int, is_admin: bool) -> Optional[bytes]:
+    """Return the cached, already-serialized JSON body for this dashboard, if any."""
+    if _aredis is None:
+        return None
+    try:
+        return await _aredis.get(_dashboard_key(user_id, is_admin))
+    except redis.RedisError as exc:
+        logger.warning("Dashboard cache read failed: %s", exc)
+        return None
+
+
+async def aset_dashboard(user_id: int, is_admin: bool, body: bytes) -> None:
+    """Cache a serialized dashboard body; hits are returned to clients byte-for-byte."""
+    if _aredis is None:
+        return
+    ttl = DASHBOARD_TTL_ADMIN if is_admin else DASHBOARD_TTL_USER
+    try:
+        await _aredis.setex(_dashboard_key(user_id, is_admin), ttl, body)
+    except redis.RedisError as exc:
+        logger.warning("Dashboard cache write failed: %s", exc)
+
+
+def invalidate_dashboard(owner_id: int) -> None:
+    """Drop cached dashboards affected by a change to a lead/activity owned by `owner_id`."""
+    if _redis is None:
+        return
+    try:
+        _redis.delete(*_dashboard_keys_for_owner(owner_id))
+    except redis.RedisError as exc:
+        logger.warning("Dashboard cache invalidation failed: %s", exc)
+
+
+async def ainvalidate_dashboard(owner_id: int) -> None:
+    """Async variant of invalidate_dashboard for async routes."""
+    if _aredis is None:
+        return
+    try:
+        await _aredis.delete(*_dashboard_keys_for_owner(owner_id))
+    except redis.RedisError as exc:
+        logger.warning("Dashboard cache invalidation failed: %s", exc)
@@ -1,12 +1,16 @@
+import asyncio
 import os
+import re
 import time
 import logging
 from typing import Optional
 
 from dotenv import load_dotenv, find_dotenv
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import DBAPIError, OperationalError
 
 # Load env vars from a local .env when running outside containers.
 # (In Docker/production, envs come from the orchestrator and this is a no-op.)
@@ -15,17 +19,31 @@ load_dotenv(find_dotenv(), override=False)
 logger = logging.getLogger("crm.database")
 
 
+# Scheme prefixes that all resolve to the psycopg 3 driver
+_URL_RE = re.compile(r"^postgres(?:ql)?(?:\+psycopg2)?://")
+
+
 def _normalize_db_url(url: str) -> str:
     """
     Accept both postgres:// and postgresql:// schemes.
-    Some platforms (e.g. Heroku) still emit postgres://; SQLAlchemy expects postgresql+psycopg2://
+    Some platforms (e.g. Heroku) still emit postgres://; SQLAlchemy expects postgresql+psycopg://
+    Legacy postgresql+psycopg2:// URLs are mapped to psycopg 3, the only driver installed.
+    URLs naming any other driver are left untouched.
+    """
+    return _URL_RE.sub("postgresql+psycopg://", url, count=1)
+
+
+def _async_db_url(url: str) -> URL:
+    """
+    Derive the asyncpg URL used by the async engine from the sync DATABASE_URL.
+    asyncpg spells libpq's `sslmode` query option as `ssl`.
     """
-    if url.startswith("postgres://"):
-        url = url.replace("postgres://", "postgresql://", 1)
-    if url.startswith("postgresql://") and "+" not in url:
-        # ensure driver is explicit to avoid ambiguity in some environments
-        url = url.replace("postgresql://", "postgresql+psycopg2://", 1)
-    return url
+    async_url = make_url(url).set(drivername="postgresql+asyncpg")
+    if "sslmode" in async_url.query:
+        query = dict(async_url.query)
+        query["ssl"] = query.pop("sslmode")
+        async_url = async_url.set(query=query)
+    return async_url
 
 
 def _compose_db_url_from_parts() -> Optional[str]:
@@ -36,7 +54,7 @@ def _compose_db_url_from_parts() -> Optional[str]:
     port = os.getenv("POSTGRES_PORT")
     db = os.getenv("POSTGRES_DB")
     if all([user, password, host, port, db]):
-        return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}"
+        return f"postgresql+psycopg://{user}:{password}@{host}:{port}/{db}"
     return None
 
 
@@ -54,6 +72,19 @@ POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
 MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
 POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in {"1", "true", "yes", "on"}
 POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 30 minutes
+# LIFO checkout keeps reusing the most recently returned connections (warmer
+# server-side caches) and lets surplus overflow connections idle out.
+POOL_LIFO = os.getenv("DB_POOL_LIFO", "true").lower() in {"1", "true", "yes", "on"}
+# psycopg 3 prepares a statement server-side once it has run this many times on a
+# connection. Set to "none" when running behind a transaction-pooling PgBouncer.
+_prepare = os.getenv("DB_PREPARE_THRESHOLD", "5").strip().lower()
+PREPARE_THRESHOLD = None if _prepare in {"", "none", "off"} else int(_prepare)
+# SQLAlchemy compiled-SQL cache (per engine). The default of 500 is tight once the
+# dashboard/list statement variants (admin vs user, optional filters) are counted.
+QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
+# asyncpg keeps prepared statements per connection; disabled along with
+# DB_PREPARE_THRESHOLD=none since transaction pooling cannot keep them either.
+STATEMENT_CACHE_SIZE = 0 if PREPARE_THRESHOLD is None else int(os.getenv("DB_STATEMENT_CACHE_SIZE", "1024"))
 
 engine = create_engine(
     DATABASE_URL,
@@ -61,12 +92,37 @@ engine = create_engine(
     max_overflow=MAX_OVERFLOW,
     pool_pre_ping=POOL_PRE_PING,
     pool_recycle=POOL_RECYCLE,
+    pool_use_lifo=POOL_LIFO,
+    query_cache_size=QUERY_CACHE_SIZE,
+    connect_args={"prepare_threshold": PREPARE_THRESHOLD},
     future=True,
 )
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
+# Async engine for the request hot path: DB waits no longer block the event loop
+# or tie up a threadpool worker. The sync engine above stays for startup DDL,
+# the admin bootstrap and scripts.
+ASYNC_DATABASE_URL = _async_db_url(DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_pre_ping=POOL_PRE_PING,
+    pool_recycle=POOL_RECYCLE,
+    pool_use_lifo=POOL_LIFO,
+    query_cache_size=QUERY_CACHE_SIZE,
+    connect_args={
+        # asyncpg's own statement cache and SQLAlchemy's asyncpg prepared-statement cache
+        "statement_cache_size": STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": STATEMENT_CACHE_SIZE,
+    },
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 # ---------------------------------------------------------------------------
 # Startup helper: wait for DB (avoids race where app starts before Postgres)
@@ -91,6 +147,27 @@ def wait_for_db(max_attempts: int = int(os.getenv("DB_WAIT_ATTEMPTS", "30")),
             time.sleep(delay_seconds)
 
 
+async def async_wait_for_db(max_attempts: int = int(os.getenv("DB_WAIT_ATTEMPTS", "30")),
+                            delay_seconds: float = float(os.getenv("DB_WAIT_DELAY", "1.0")),
+                            timeout_seconds: float = float(os.getenv("DB_WAIT_TIMEOUT", "5.0"))) -> None:
+    """Async variant of wait_for_db: probes through the async engine and sleeps without blocking the loop."""
+    attempt = 0
+    while True:
+        try:
+            async with asyncio.timeout(timeout_seconds):
+                async with async_engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+            if attempt:
+                logger.info("Database became available after %d attempts", attempt)
+            return
+        except (DBAPIError, OSError, TimeoutError) as exc:
+            attempt += 1
+            if attempt >= max_attempts:
+                logger.error("Database not available after %d attempts: %s", attempt, exc)
+                raise
+            await asyncio.sleep(delay_seconds)
+
+
 # Dependency for FastAPI routes
 
 def get_db():
@@ -98,4 +175,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,11 +1,12 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 import os
 import logging
-from sqlalchemy import inspect, text
-from .database import Base, engine, SessionLocal, wait_for_db
-from . import models
-from .auth import hash_password
+from .database import async_engine, async_wait_for_db
+from . import manage
 
 from .routers import users, leads, activities, dashboard
 
@@ -20,7 +21,6 @@ try:
 except Exception:
     # Case 2: scripts directory is at project root (sibling of "app")
     try:
-        import os
         import sys
         _root = os.path.dirname(os.path.dirname(__file__))  # /app (repo backend root in the container)
         if _root not in sys.path:
@@ -38,89 +38,68 @@ logger = logging.getLogger("crm.main")
 
 # --- CORS Configuration ---
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost,http://localhost:5173")
-ALLOWED_ORIGINS = [o.strip() for o in FRONTEND_ORIGIN.split(",") if o.strip()]
+ALLOWED_ORIGINS = tuple(o.strip() for o in FRONTEND_ORIGIN.split(",") if o.strip())
 if "*" in ALLOWED_ORIGINS:
     logger.warning("CORS is set to '*'. This is unsafe for production!")
 
 # --- Flags ---
-CREATE_ADMIN_ON_STARTUP = os.getenv("CREATE_ADMIN_ON_STARTUP", "false").lower() in {"1", "true", "yes", "on"}
-AUTO_CREATE_TABLES = os.getenv("AUTO_CREATE_TABLES", "false").lower() in {"1", "true", "yes", "on"}
+# When the deploy runs `python -m app.manage init` once up front, workers skip it.
+# Otherwise workers run manage.init_schema_and_admin: admin bootstrap, plus creating
+# missing tables only when AUTO_CREATE_TABLES is set. Migrations of existing tables
+# (columns, indexes, backfills) only ever run from `manage init`.
+SKIP_STARTUP_INIT = os.getenv("SKIP_STARTUP_INIT", "false").lower() in {"1", "true", "yes", "on"}
 ENVIRONMENT = os.getenv("ENV", "development")
+# Responses smaller than this (bytes) are sent uncompressed
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+# Compression runs on the event loop; levels above ~6 cost much more CPU for little size gain
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+# --- Lifespan ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info(f"🚀 Starting CRM backend in {ENVIRONMENT.upper()} mode...")
+    await async_wait_for_db()
+
+    if SKIP_STARTUP_INIT:
+        logger.info("SKIP_STARTUP_INIT set: schema/admin init is left to `python -m app.manage init`.")
+    else:
+        await run_in_threadpool(manage.init_schema_and_admin)
+        logger.info("✅ Startup complete.")
+
+    yield
+
+    await async_engine.dispose()
+
 
 # --- FastAPI App ---
 app = FastAPI(
     title="CRM API",
     version="1.0.0",
     description="Backend API for CRM Application with Users, Leads, and Activities",
+    lifespan=lifespan,
 )
 
 # --- Middleware ---
+class FrozenOriginCORSMiddleware(CORSMiddleware):
+    """CORSMiddleware whose per-request origin check is a frozenset lookup instead of a list scan."""
+
+    def __init__(self, app, **kwargs):
+        super().__init__(app, **kwargs)
+        self.allow_origins = frozenset(self.allow_origins)
+
+
 app.add_middleware(
-    CORSMiddleware,
+    FrozenOriginCORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-
-def _bootstrap_admin_once() -> None:
-    """Create the initial admin exactly once across all workers."""
-    if not CREATE_ADMIN_ON_STARTUP:
-        logger.info("Startup complete (admin bootstrap disabled).")
-        return
-
-    admin_email = os.getenv("ADMIN_EMAIL")
-    admin_password = os.getenv("ADMIN_PASSWORD")
-    if not admin_email or not admin_password:
-        logger.warning("Admin bootstrap enabled but ADMIN_EMAIL or ADMIN_PASSWORD missing; skipping.")
-        return
-
-    LOCK_KEY = 80451234567890
-    with engine.begin() as conn:
-        got_lock = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": LOCK_KEY}).scalar()
-        if not got_lock:
-            logger.info("Another process is handling admin bootstrap. Skipping.")
-            return
-        try:
-            db = SessionLocal(bind=conn)
-            try:
-                existing = db.query(models.User).filter(models.User.email == admin_email).first()
-                if existing:
-                    logger.info(f"Admin '{admin_email}' already exists; skipping creation.")
-                    return
-                hashed_password = hash_password(admin_password)
-                user = models.User(
-                    email=admin_email,
-                    password_hash=hashed_password,
-                    is_admin=True,
-                    first_name="Admin",
-                    last_name="User"
-                )
-                db.add(user)
-                db.commit()
-                logger.info(f"✅ Admin '{admin_email}' created on startup.")
-            finally:
-                db.close()
-        finally:
-            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
-
-
-@app.on_event("startup")
-def on_startup():
-    logger.info(f"🚀 Starting CRM backend in {ENVIRONMENT.upper()} mode...")
-    wait_for_db()
-
-    if AUTO_CREATE_TABLES:
-        Base.metadata.create_all(bind=engine)
-        logger.info("✅ AUTO_CREATE_TABLES enabled: all tables ensured.")
-
-    inspector = inspect(engine)
-    if inspector.has_table("users"):
-        _bootstrap_admin_once()
-        logger.info("✅ Startup complete.")
-    else:
-        logger.warning("⚠️ DB schema not detected (no 'users' table). Skipping admin bootstrap.")
+# Compress responses for clients sending Accept-Encoding: gzip. CSV exports and lead
+# pages are plain text and shrink several-fold. Streamed responses are compressed as
+# they go, but the compressor is not flushed per chunk, so output leaves in bursts.
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
 
 
 # --- Routers ---
@@ -0,0 +1,336 @@
+"""
+One-shot maintenance commands, run once per deploy instead of in every worker:
+
+    python -m app.manage init
+
+`init` waits for the database, ensures extensions and tables (AUTO_CREATE_TABLES), adds any
+columns and indexes declared on the models that an existing database is missing, and creates the
+initial admin (CREATE_ADMIN_ON_STARTUP). Workers started with SKIP_STARTUP_INIT=true
+then skip all of it on boot; otherwise they only create missing tables (AUTO_CREATE_TABLES)
+and bootstrap the admin, and never alter existing tables.
+"""
+import argparse
+import logging
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import insert, inspect, select, text
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+from .database import Base, engine, wait_for_db
+from . import models
+from .auth import hash_password
+
+logger = logging.getLogger("crm.manage")
+
+# --- Flags ---
+CREATE_ADMIN_ON_STARTUP = os.getenv("CREATE_ADMIN_ON_STARTUP", "false").lower() in {"1", "true", "yes", "on"}
+AUTO_CREATE_TABLES = os.getenv("AUTO_CREATE_TABLES", "false").lower() in {"1", "true", "yes", "on"}
+
+SCHEMA_LOCK_KEY = 80451234567891
+
+
+@contextmanager
+def schema_lock():
+    """
+    Session-level advisory lock serializing schema work across processes (several
+    replicas running `manage init`, workers creating tables). Held on its own
+    AUTOCOMMIT connection so it never pins a snapshot that CREATE INDEX CONCURRENTLY
+    would wait on.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": SCHEMA_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": SCHEMA_LOCK_KEY})
+
+
+def bootstrap_admin_once() -> None:
+    """Create the initial admin exactly once across all workers."""
+    if not CREATE_ADMIN_ON_STARTUP:
+        logger.info("Admin bootstrap disabled.")
+        return
+
+    admin_email = (os.getenv("ADMIN_EMAIL") or "").strip().lower()
+    admin_password = os.getenv("ADMIN_PASSWORD")
+    if not admin_email or not admin_password:
+        logger.warning("Admin bootstrap enabled but ADMIN_EMAIL or ADMIN_PASSWORD missing; skipping.")
+        return
+
+    # Cheap lock-free check first: on every boot after the first, the admin exists
+    # and no worker needs to touch the advisory lock at all.
+    admin_exists = select(models.User.id).where(models.User.email == admin_email).limit(1)
+    with engine.connect() as conn:
+        if conn.execute(admin_exists).first():
+            logger.info(f"Admin '{admin_email}' already exists; skipping creation.")
+            return
+
+    LOCK_KEY = 80451234567890
+    with engine.begin() as conn:
+        # Transaction-scoped lock: released by the commit/rollback, no explicit unlock
+        got_lock = conn.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": LOCK_KEY}).scalar()
+        if not got_lock:
+            logger.info("Another process is handling admin bootstrap. Skipping.")
+            return
+        # Re-check under the lock in case another process created it meanwhile
+        if conn.execute(admin_exists).first():
+            logger.info(f"Admin '{admin_email}' already exists; skipping creation.")
+            return
+        conn.execute(
+            insert(models.User).values(
+                email=admin_email,
+                password_hash=hash_password(admin_password),
+                is_admin=True,
+                first_name="Admin",
+                last_name="User",
+            )
+        )
+    logger.info(f"✅ Admin '{admin_email}' created.")
+
+
+def ensure_extensions() -> bool:
+    """
+    Create the Postgres extensions the model indexes depend on (pg_trgm for lead search).
+    Returns whether pg_trgm is installed; when it is not, ensure_indexes() skips the
+    trigram index and lead search falls back to sequential scans.
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as exc:
+        logger.error("Could not create extension pg_trgm: %s", exc)
+    with engine.connect() as conn:
+        has_trgm = conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+    if not has_trgm:
+        logger.error("pg_trgm is not installed; skipping trigram indexes (lead search will not use an index).")
+    return has_trgm
+
+
+def _needs_pg_trgm(index) -> bool:
+    """True for indexes using a pg_trgm operator class (e.g. ix_leads_search_trgm)."""
+    ops = index.dialect_options["postgresql"]["ops"] or {}
+    return any("trgm" in op for op in ops.values())
+
+
+def create_missing_tables() -> set:
+    """
+    Create tables missing from the database, without their indexes, and return their
+    names. Unlike create_all(), this leaves every index to ensure_indexes(), which can
+    skip the ones whose extension is unavailable instead of aborting the whole init.
+    """
+    inspector = inspect(engine)
+    created = set()
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                conn.execute(CreateTable(table))
+                created.add(table.name)
+                logger.info("✅ Created table %s.", table.name)
+    return created
+
+
+def ensure_columns() -> None:
+    """
+    Add model-declared columns missing from existing tables (e.g. generated columns such
+    as leads.search_tsv). create_missing_tables() never alters a table that exists.
+    Adding a STORED generated column rewrites the table under an ACCESS EXCLUSIVE lock,
+    so this only runs from `python -m app.manage init` (never from a worker's startup);
+    run that during a deploy window on large tables.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = CreateColumn(column).compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {ddl}"))
+                logger.info("✅ Added column %s.%s.", table.name, column.name)
+            except Exception as exc:
+                logger.error("Could not add column %s.%s: %s", table.name, column.name, exc)
+
+
+def normalize_user_emails() -> None:
+    """
+    One-time backfill (run by `manage init` only): lower-case emails stored mixed-case
+    before register/bootstrap normalized them, so login's `email = :e` lookup finds
+    them and ux_users_email_lower can be built. Once that index exists the backfill
+    is done and this returns without touching the table. Case-only duplicates are
+    reported by id and left untouched; they must be merged by hand.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table("users"):
+        return
+    if any(ix["name"] == "ux_users_email_lower" for ix in inspector.get_indexes("users")):
+        return
+
+    with engine.begin() as conn:
+        conflicts = conn.execute(
+            text(
+                "SELECT lower(email), array_agg(id ORDER BY id) FROM users "
+                "GROUP BY lower(email) HAVING count(*) > 1"
+            )
+        ).all()
+        if conflicts:
+            for email, ids in conflicts:
+                logger.error("Users %s differ only by email case (%s); merge them by hand.", ids, email)
+            logger.error("Skipping email lower-casing: %d case-only duplicate(s).", len(conflicts))
+            return
+        updated = conn.execute(
+            text("UPDATE users SET email = lower(email) WHERE email <> lower(email)")
+        ).rowcount
+    if updated:
+        logger.info("✅ Lower-cased %d user email(s).", updated)
+
+
+# Indexes once declared on the models and since replaced; dropped by `manage init`
+SUPERSEDED_INDEXES = (
+    "ix_leads_user_active_created",  # -> ix_leads_user_active_created_id (adds id)
+)
+
+
+def drop_superseded_indexes() -> None:
+    """Drop indexes listed in SUPERSEDED_INDEXES (concurrently, so writes are not blocked)."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in SUPERSEDED_INDEXES:
+            if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar() is None:
+                continue
+            try:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+                logger.info("✅ Dropped superseded index %s.", name)
+            except Exception as exc:
+                logger.error("Could not drop superseded index %s: %s", name, exc)
+
+
+def _invalid_indexes(conn, table_name: str) -> set:
+    """Names of INVALID indexes on a table (left behind by a failed CREATE INDEX CONCURRENTLY)."""
+    rows = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_class t ON t.oid = i.indrelid "
+            "WHERE t.relname = :t AND NOT i.indisvalid"
+        ),
+        {"t": table_name},
+    )
+    return {name for (name,) in rows}
+
+
+def _create_index_concurrently_sql(index) -> str:
+    """CREATE [UNIQUE] INDEX CONCURRENTLY IF NOT EXISTS ... for a model-declared index."""
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+    # Spliced into the DDL text rather than set on index.dialect_options, which would
+    # mutate the process-wide metadata shared with the app
+    return ddl.replace(" INDEX IF NOT EXISTS ", " INDEX CONCURRENTLY IF NOT EXISTS ", 1)
+
+
+def ensure_indexes(has_pg_trgm: bool = True, rebuild_invalid: bool = False, only_tables=None) -> None:
+    """
+    Create model-declared indexes missing from existing tables (or just `only_tables`):
+    those of tables just made by create_missing_tables(), and any index added to the
+    models later.
+    Trigram indexes are skipped when `has_pg_trgm` is false. Indexes are built with
+    CREATE INDEX CONCURRENTLY (outside a transaction) so live tables are not
+    write-locked during the build; one failure is logged and does not block the rest.
+    A failed concurrent build leaves an INVALID index under the same name, but so
+    does a build still in progress elsewhere; only `manage init` (rebuild_invalid,
+    under schema_lock) drops and rebuilds those, other callers leave them alone.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if only_tables is not None and table.name not in only_tables:
+            continue
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            invalid = _invalid_indexes(conn, table.name)
+            for index in table.indexes:
+                if index.name in existing and (index.name not in invalid or not rebuild_invalid):
+                    continue
+                if not has_pg_trgm and _needs_pg_trgm(index):
+                    logger.warning("Skipping index %s on %s: pg_trgm is not installed.", index.name, table.name)
+                    continue
+                try:
+                    if index.name in invalid:
+                        logger.warning("Index %s on %s is INVALID; dropping it to rebuild.", index.name, table.name)
+                        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+                    conn.execute(text(_create_index_concurrently_sql(index)))
+                    logger.info("✅ Created index %s on %s.", index.name, table.name)
+                except Exception as exc:
+                    logger.error("Could not create index %s on %s: %s", index.name, table.name, exc)
+
+
+def init_schema_and_admin() -> None:
+    """
+    Worker-startup init (when SKIP_STARTUP_INIT is unset). Assumes the DB is reachable.
+    Runs no DDL unless AUTO_CREATE_TABLES is set, and then only creates missing tables
+    with their indexes, as create_all() did; existing tables are never altered here
+    (that is `manage init`'s migrate()). Then bootstraps the admin.
+    """
+    if AUTO_CREATE_TABLES:
+        with schema_lock():
+            created = create_missing_tables()
+            if created:
+                has_pg_trgm = ensure_extensions()
+                ensure_indexes(has_pg_trgm, only_tables=created)
+        logger.info("✅ AUTO_CREATE_TABLES enabled: all tables ensured.")
+
+    _bootstrap_admin_if_schema()
+
+
+def _bootstrap_admin_if_schema() -> None:
+    inspector = inspect(engine)
+    if inspector.has_table("users"):
+        bootstrap_admin_once()
+    else:
+        logger.warning("⚠️ DB schema not detected (no 'users' table). Skipping admin bootstrap.")
+
+
+def migrate() -> None:
+    """
+    Schema changes for existing databases, run only by `python -m app.manage init`:
+    steps that rewrite or lock whole tables and must not run on every worker boot.
+    """
+    with schema_lock():
+        has_pg_trgm = ensure_extensions()
+
+        if AUTO_CREATE_TABLES:
+            create_missing_tables()
+            logger.info("✅ AUTO_CREATE_TABLES enabled: all tables ensured.")
+
+        ensure_columns()
+        normalize_user_emails()
+        ensure_indexes(has_pg_trgm, rebuild_invalid=True)
+        # After the replacements exist, so the planner is never left without one
+        drop_superseded_indexes()
+
+
+def init() -> None:
+    wait_for_db()
+    migrate()
+    _bootstrap_admin_if_schema()
+    logger.info("✅ Init complete.")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.manage", description="CRM backend maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("init", help="wait for the DB, ensure tables/indexes and bootstrap the admin")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        level=logging.INFO,
+    )
+    if args.command == "init":
+        init()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Index, text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, Integer, String, Boolean, DateTime, ForeignKey, Text, Index, literal, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import column_property, deferred, relationship
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -15,10 +16,27 @@ class User(Base):
     is_admin = Column(Boolean, nullable=False, server_default="false")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Name shown as a lead's owner_name / assigned_to: "first last" when either is set,
+    # else the email. Computed by Postgres in the same SELECT that loads the user.
+    display_name = column_property(
+        func.coalesce(
+            func.nullif(
+                func.concat_ws(" ", func.nullif(func.trim(first_name), ""), func.nullif(func.trim(last_name), "")),
+                "",
+            ),
+            email,
+        )
+    )
+
     activities = relationship("Activity", back_populates="user")
     leads = relationship("Lead", back_populates="owner", cascade="all, delete-orphan")
 
 
+# Emails are stored lower-cased (register, admin bootstrap, seed) so login keeps
+# probing the plain unique index on `email`; this one rejects case-only duplicates.
+Index("ux_users_email_lower", func.lower(User.email), unique=True)
+
+
 class Lead(Base):
     __tablename__ = "leads"
     __table_args__ = (
@@ -28,6 +46,32 @@ class Lead(Base):
             "status",
             "created_at",
         ),
+        # Per-owner scans of active leads: dashboard counters / recent leads (created_at range),
+        # the leads list ORDER BY created_at DESC, id DESC (read backwards, no sort node, and
+        # the keyset cursor seek) and the won/lost-this-month counters (status + updated_at
+        # range). Partial on is_active so soft-deleted rows never enter the index.
+        Index(
+            "ix_leads_user_active_created_id",
+            "user_id",
+            "created_at",
+            "id",
+            postgresql_where=text("is_active"),
+        ),
+        # Same ordering for admins, whose list/recent-leads queries have no user_id predicate
+        Index(
+            "ix_leads_active_created_id",
+            "created_at",
+            "id",
+            postgresql_where=text("is_active"),
+        ),
+        Index(
+            "ix_leads_user_active_status_updated",
+            "user_id",
+            "status",
+            "updated_at",
+            postgresql_where=text("is_active"),
+        ),
+        Index("ix_leads_search_tsv", "search_tsv", postgresql_using="gin"),
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -51,12 +95,58 @@ class Lead(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+    # Full-text document for multi-word search, maintained by Postgres. Deferred: it is
+    # only ever used in WHERE clauses, never loaded.
+    search_tsv = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                "to_tsvector('simple', coalesce(first_name, '') || ' ' || coalesce(last_name, '') "
+                "|| ' ' || coalesce(email, ''))",
+                persisted=True,
+            ),
+        )
+    )
+
     activities = relationship("Activity", back_populates="lead", cascade="all, delete-orphan")
     owner = relationship("User", back_populates="leads")
 
 
+# Lower-cased "first last email" haystack for the leads search box. Built from ||
+# and coalesce (both IMMUTABLE, unlike concat_ws) so it can back an expression index.
+# The constants are inlined (not bound) so queries match the index expression even
+# under prepared/generic plans.
+_EMPTY = literal("", literal_execute=True)
+_SPACE = literal(" ", literal_execute=True)
+lead_search_text = func.lower(
+    func.coalesce(Lead.first_name, _EMPTY).concat(_SPACE)
+    .concat(func.coalesce(Lead.last_name, _EMPTY)).concat(_SPACE)
+    .concat(func.coalesce(Lead.email, _EMPTY))
+)
+
+# Trigram GIN index so `lead_search_text LIKE '%q%'` is an index scan instead of a
+# seq scan of three ILIKEs. Requires the pg_trgm extension (see manage.ensure_extensions).
+Index(
+    "ix_leads_search_trgm",
+    lead_search_text.label("search_text"),
+    postgresql_using="gin",
+    postgresql_ops={"search_text": "gin_trgm_ops"},
+)
+
+
 class Activity(Base):
     __tablename__ = "activities"
+    __table_args__ = (
+        # Serves the per-lead timeline (lead_id = ? ORDER BY activity_date DESC, created_at DESC)
+        # as an index range scan; INCLUDE covers the list columns for index-only reads.
+        Index(
+            "ix_activities_lead_date",
+            "lead_id",
+            text("activity_date DESC"),
+            text("created_at DESC"),
+            postgresql_include=["activity_type", "title", "duration"],
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     lead_id = Column(Integer, ForeignKey("leads.id"), nullable=False)
@@ -1,41 +1,58 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from types import SimpleNamespace
 from typing import List
 from datetime import datetime, timezone
-from ..database import get_db
-from .. import models
+from ..database import get_async_db
+from .. import cache, models
 from ..schemas import ActivityCreate, ActivityOut
 from .users import get_current_user
 
 router = APIRouter(prefix="/leads/{lead_id}/activities", tags=["activities"])
 
-def _get_active_lead(db: Session, lead_id: int, user) -> models.Lead:
-    lead = db.get(models.Lead, lead_id)
-    if not lead or not getattr(lead, "is_active", True):
+async def _get_active_lead(db: AsyncSession, lead_id: int, user) -> SimpleNamespace:
+    """
+    Authorize access to an active lead. Only the owner id is fetched (not the whole
+    row with its notes), and a lightweight namespace is returned in place of the ORM object.
+    """
+    owner_id = (
+        await db.execute(
+            select(models.Lead.user_id).where(models.Lead.id == lead_id, models.Lead.is_active.is_(True))
+        )
+    ).scalar_one_or_none()
+    if owner_id is None:
         raise HTTPException(404, "Lead not found or is archived")
     # Only owners can access unless admin
-    if not getattr(user, "is_admin", False) and lead.user_id != user.id:
+    if not getattr(user, "is_admin", False) and owner_id != user.id:
         raise HTTPException(403, "Not permitted")
-    return lead
+    return SimpleNamespace(id=lead_id, user_id=owner_id)
 
 @router.get("", response_model=List[ActivityOut])
-def list_activities(lead_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    _get_active_lead(db, lead_id, user)
-    return (
-        db.query(models.Activity)
-          .filter(models.Activity.lead_id == lead_id)
+async def list_activities(lead_id: int, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    # Authorize and fetch in one statement; only an empty result needs the extra
+    # probe to tell "no activities yet" apart from 404/403.
+    stmt = (
+        select(models.Activity)
+          .join(models.Lead, models.Lead.id == models.Activity.lead_id)
+          .where(models.Lead.id == lead_id, models.Lead.is_active.is_(True))
           .order_by(models.Activity.activity_date.desc(), models.Activity.created_at.desc())
-          .all()
     )
+    if not getattr(user, "is_admin", False):
+        stmt = stmt.where(models.Lead.user_id == user.id)
+    activities = (await db.execute(stmt)).scalars().all()
+    if not activities:
+        await _get_active_lead(db, lead_id, user)
+    return activities
 
 @router.post("", response_model=ActivityOut, status_code=201)
-def add_activity(
+async def add_activity(
     lead_id: int,
     payload: ActivityCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(get_current_user),
 ):
-    _get_active_lead(db, lead_id, user)
+    lead = await _get_active_lead(db, lead_id, user)
     # Server-side rule: for call activities, duration must be a positive integer
     if payload.activity_type == "call":
         if payload.duration is None or not isinstance(payload.duration, int) or payload.duration <= 0:
@@ -45,8 +62,10 @@ def add_activity(
     if not data.get("activity_date"):
         data["activity_date"] = datetime.now(timezone.utc)
 
-    act = models.Activity(lead_id=lead_id, user_id=user.id, **data)
-    db.add(act)
-    db.commit()
-    db.refresh(act)
+    # RETURNING hands back server defaults (created_at) with the INSERT itself,
+    # so no follow-up refresh SELECT is needed
+    stmt = insert(models.Activity).values(lead_id=lead_id, user_id=user.id, **data).returning(models.Activity)
+    act = (await db.execute(stmt)).scalar_one()
+    await db.commit()
+    await cache.ainvalidate_dashboard(lead.user_id)
     return act
\ No newline at end of file
@@ -1,16 +1,57 @@
+import asyncio
+import os
 from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, Date
-from ..database import get_db
-from .. import models
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy import DateTime, bindparam, func, select, text, tuple_
+from ..database import AsyncSessionLocal
+from .. import cache, models
 from .users import get_current_user
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
-@router.get("")
-def dashboard(db: Session = Depends(get_db), user=Depends(get_current_user)):
+
+_TREND_8W_SQL = """
+    SELECT gs.wk::date AS week_start, COALESCE(c.cnt, 0) AS count
+    FROM generate_series(date_trunc('week', :start), date_trunc('week', now()), interval '1 week') AS gs(wk)
+    LEFT JOIN (
+        SELECT date_trunc('week', created_at) AS wk, count(*) AS cnt
+        FROM leads
+        WHERE is_active AND created_at >= date_trunc('week', :start){owner}
+        GROUP BY 1
+    ) c ON c.wk = gs.wk
+    ORDER BY gs.wk
+"""
+# Separate admin/user statements (rather than `:is_admin OR user_id = :uid`) so the
+# per-user variant can always use the user_id index, including under generic plans.
+_TREND_8W_ADMIN = text(_TREND_8W_SQL.format(owner="")).bindparams(
+    bindparam("start", type_=DateTime(timezone=True))
+)
+_TREND_8W_USER = text(_TREND_8W_SQL.format(owner=" AND user_id = :uid")).bindparams(
+    bindparam("start", type_=DateTime(timezone=True))
+)
+
+
+# Pooled connections one dashboard request may hold at once. The queries are
+# independent and overlap under gather(), but each needs its own connection; with
+# the default async pool (DB_POOL_SIZE 5 + DB_MAX_OVERFLOW 10) an uncapped fan-out
+# of 7 exhausted the pool at two concurrent dashboards per worker.
+DASHBOARD_DB_CONCURRENCY = int(os.getenv("DASHBOARD_DB_CONCURRENCY", "2"))
+
+
+async def _fetch_all(limit: asyncio.Semaphore, stmt, params=None):
+    """
+    Run one dashboard query on its own session, once one of the request's `limit`
+    connection slots is free; the connection goes back to the pool right after.
+    """
+    async with limit:
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(stmt, params)).all()
+
+
+@router.get("", response_class=ORJSONResponse)
+async def dashboard(user=Depends(get_current_user)):
     """
     Returns a rich dashboard payload.
     NOTE: Existing fields (total_leads, leads_by_status, recent_activities)
@@ -18,194 +59,107 @@ def dashboard(db: Session = Depends(get_db), user=Depends(get_current_user)):
     All metrics are scoped to the current user unless the user is admin.
     """
     is_admin = bool(getattr(user, "is_admin", False))
+    cached = await cache.aget_dashboard(user.id, is_admin)
+    if cached is not None:
+        # Cached bytes are the exact response body: no decode/re-encode round trip
+        return Response(content=cached, media_type="application/json")
+
     now = datetime.now(timezone.utc)
 
+    # Today as a half-open [00:00, next 00:00) range so created_at stays index-usable
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today_end = today_start + timedelta(days=1)
     # Week starts Monday 00:00 (ISO week)
     week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
     # Month starts on the 1st 00:00
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
-    # ---------- Base lead scope (active only) ----------
-    lead_q = db.query(models.Lead).filter(models.Lead.is_active.is_(True))
-    if not is_admin:
-        lead_q = lead_q.filter(models.Lead.user_id == user.id)
-
-    # ---------- Totals ----------
-    total_leads = lead_q.count()
-
-    # total activities (scoped)
-    act_total_q = db.query(models.Activity).join(models.Lead, models.Activity.lead_id == models.Lead.id)
-    if not is_admin:
-        act_total_q = act_total_q.filter(models.Lead.user_id == user.id)
-    total_activities = act_total_q.count()
-
-    # by_status
-    status_rows = (
-        db.query(models.Lead.status, func.count(models.Lead.id))
-        .filter(models.Lead.is_active.is_(True))
-    )
-    if not is_admin:
-        status_rows = status_rows.filter(models.Lead.user_id == user.id)
-    status_rows = status_rows.group_by(models.Lead.status).all()
-    leads_by_status = {s: c for (s, c) in status_rows}
-
-    # by_source
-    source_rows = (
-        db.query(models.Lead.source, func.count(models.Lead.id))
-        .filter(models.Lead.is_active.is_(True))
-    )
-    if not is_admin:
-        source_rows = source_rows.filter(models.Lead.user_id == user.id)
-    source_rows = source_rows.group_by(models.Lead.source).all()
-    # store None source as "unknown" for frontend convenience
-    leads_by_source = { (s or "unknown"): c for (s, c) in source_rows }
+    # ---------- Scopes, built once and reused by every query ----------
+    # owner_scope: leads visible to this user; lead_scope additionally keeps active leads only
+    owner_scope = () if is_admin else (models.Lead.user_id == user.id,)
+    lead_scope = (models.Lead.is_active.is_(True), *owner_scope)
+    # Activities are scoped by a semi-join on the in-scope lead ids rather than a JOIN,
+    # so activities are read via ix_activities_lead_date instead of per-row lead lookups
+    activity_scope = (models.Activity.lead_id.in_(select(models.Lead.id).where(*lead_scope)),)
 
     # ---------- Time buckets ----------
     d7_ago = now - timedelta(days=7)
     d30_ago = now - timedelta(days=30)
+    start_8w = now - timedelta(weeks=7)
 
-    new_leads_today = (
-        lead_q.session.query(func.count(models.Lead.id))
-        .select_from(models.Lead)
-        .filter(
-            models.Lead.is_active.is_(True),
-            cast(models.Lead.created_at, Date) == cast(now, Date),
-            *( [] if is_admin else [models.Lead.user_id == user.id] )
-        )
-        .scalar()
-    )
-
-    new_leads_7d = (
-        lead_q.session.query(func.count(models.Lead.id))
-        .select_from(models.Lead)
-        .filter(
-            models.Lead.is_active.is_(True),
-            models.Lead.created_at >= d7_ago,
-            *( [] if is_admin else [models.Lead.user_id == user.id] )
-        )
-        .scalar()
-    )
-
-    # New leads this week (from week_start)
-    new_leads_this_week = (
-        lead_q.session.query(func.count(models.Lead.id))
-        .select_from(models.Lead)
-        .filter(
-            models.Lead.is_active.is_(True),
-            models.Lead.created_at >= week_start,
-            *( [] if is_admin else [models.Lead.user_id == user.id] )
-        )
-        .scalar()
-    )
+    # ---------- Lead metrics: one pass with conditional aggregates ----------
+    lead_stats_q = select(
+        func.count(models.Lead.id).label("total"),
+        func.count(models.Lead.id).filter(
+            models.Lead.created_at >= today_start, models.Lead.created_at < today_end
+        ).label("today"),
+        func.count(models.Lead.id).filter(models.Lead.created_at >= d7_ago).label("d7"),
+        # New leads this week (from week_start)
+        func.count(models.Lead.id).filter(models.Lead.created_at >= week_start).label("this_week"),
+        func.count(models.Lead.id).filter(models.Lead.created_at >= d30_ago).label("d30"),
+        # Win / loss (last 30 days)
+        func.count(models.Lead.id).filter(
+            models.Lead.status == "won", models.Lead.updated_at >= d30_ago
+        ).label("won_30d"),
+        func.count(models.Lead.id).filter(
+            models.Lead.status == "lost", models.Lead.updated_at >= d30_ago
+        ).label("lost_30d"),
+        # Closed leads this month ("won" updated in current month)
+        func.count(models.Lead.id).filter(
+            models.Lead.status == "won", models.Lead.updated_at >= month_start
+        ).label("closed_this_month"),
+    ).where(*lead_scope)
 
-    new_leads_30d = (
-        lead_q.session.query(func.count(models.Lead.id))
-        .select_from(models.Lead)
-        .filter(
-            models.Lead.is_active.is_(True),
-            models.Lead.created_at >= d30_ago,
-            *( [] if is_admin else [models.Lead.user_id == user.id] )
+    # ---------- Activity metrics: total + last 30 days in one pass ----------
+    act_stats_q = (
+        select(
+            func.count(models.Activity.id).label("total"),
+            func.count(models.Activity.id).filter(models.Activity.activity_date >= d30_ago).label("d30"),
         )
-        .scalar()
+        .where(*activity_scope)
     )
 
-    # Win / loss (last 30 days)
-    won_30d = (
-        lead_q.session.query(func.count(models.Lead.id))
-        .select_from(models.Lead)
-        .filter(
-            models.Lead.is_active.is_(True),
-            models.Lead.status == "won",
-            models.Lead.updated_at >= d30_ago,
-            *( [] if is_admin else [models.Lead.user_id == user.id] )
-        )
-        .scalar()
-    )
-    lost_30d = (
-        lead_q.session.query(func.count(models.Lead.id))
-        .select_from(models.Lead)
-        .filter(
-            models.Lead.is_active.is_(True),
-            models.Lead.status == "lost",
-            models.Lead.updated_at >= d30_ago,
-            *( [] if is_admin else [models.Lead.user_id == user.id] )
+    # by_status + by_source in one scan via GROUPING SETS; GROUPING(status) = 0 marks
+    # the status rows (so a NULL status/source group is still told apart correctly)
+    breakdown_q = (
+        select(
+            func.grouping(models.Lead.status).label("by_source"),
+            models.Lead.status,
+            models.Lead.source,
+            func.count(models.Lead.id),
         )
-        .scalar()
+        .where(*lead_scope)
+        .group_by(func.grouping_sets(tuple_(models.Lead.status), tuple_(models.Lead.source)))
     )
-    denom = won_30d + lost_30d
-    win_rate_30d = (won_30d / denom) if denom else 0.0
 
-    # Closed leads this month ("won" updated in current month)
-    closed_leads_this_month = (
-        lead_q.session.query(func.count(models.Lead.id))
-        .select_from(models.Lead)
-        .filter(
-            models.Lead.is_active.is_(True),
-            models.Lead.status == "won",
-            models.Lead.updated_at >= month_start,
-            *( [] if is_admin else [models.Lead.user_id == user.id] )
+    # recent activities (keep original shape); only the rendered columns are fetched
+    recent_act_q = (
+        select(
+            models.Activity.id,
+            models.Activity.lead_id,
+            models.Activity.activity_type,
+            models.Activity.title,
+            models.Activity.activity_date,
         )
-        .scalar()
-    )
-
-    # ---------- Activities ----------
-    act_q = db.query(models.Activity).join(models.Lead, models.Activity.lead_id == models.Lead.id)
-    if not is_admin:
-        act_q = act_q.filter(models.Lead.user_id == user.id)
-
-    # recent activities (keep original shape)
-    recent_activities = (
-        act_q.order_by(models.Activity.activity_date.desc())
+        .where(*activity_scope)
+        .order_by(models.Activity.activity_date.desc())
         .limit(10)
-        .all()
     )
 
     # activities by type in last 30 days
-    act_type_rows = (
-        act_q.filter(models.Activity.activity_date >= d30_ago)
-        .with_entities(models.Activity.activity_type, func.count(models.Activity.id))
+    act_type_q = (
+        select(models.Activity.activity_type, func.count(models.Activity.id))
+        .where(models.Activity.activity_date >= d30_ago, *activity_scope)
         .group_by(models.Activity.activity_type)
-        .all()
     )
-    activities_by_type_30d = {t: c for (t, c) in act_type_rows}
-
-    # average activities per active lead (last 30 days window)
-    act_count_30d = act_q.filter(models.Activity.activity_date >= d30_ago).count()
-    avg_activities_per_lead_30d = (act_count_30d / total_leads) if total_leads else 0.0
 
     # ---------- Weekly trend for the last 8 weeks ----------
-    start_8w = now - timedelta(weeks=7)
-    # Use Postgres date_trunc('week', ...) to bucket
-    weekly_rows = (
-        db.query(
-            func.date_trunc('week', models.Lead.created_at).label('wk'),
-            func.count(models.Lead.id)
-        )
-        .filter(
-            models.Lead.is_active.is_(True),
-            models.Lead.created_at >= start_8w,
-            *( [] if is_admin else [models.Lead.user_id == user.id] )
-        )
-        .group_by('wk')
-        .order_by('wk')
-        .all()
-    )
-    # Convert to dict with ISO dates (YYYY-MM-DD) and fill missing weeks with 0
-    week_counts = { (wk.date().isoformat() if hasattr(wk, "date") else str(wk)): c for (wk, c) in weekly_rows }
-    # Build an ordered list of 8 week starts
-    weeks_list = []
-    # Normalize to week starts (Monday) for display
-    # date_trunc('week') returns Monday 00:00 in Postgres
-    for i in range(8):
-        w = (start_8w + timedelta(weeks=i))
-        w_key = w.date().isoformat()
-        weeks_list.append({"week_start": w_key, "count": int(week_counts.get(w_key, 0))})
+    # generate_series yields all 8 Monday-aligned weeks (empty ones as 0), already ordered
+    trend_params = {"start": start_8w} if is_admin else {"start": start_8w, "uid": user.id}
 
     # ---------- Recent leads list (for "Recent" widget) ----------
-    recent_leads = (
-        lead_q.order_by(models.Lead.created_at.desc())
-        .limit(5)
-        .with_entities(
+    recent_leads_q = (
+        select(
             models.Lead.id,
             models.Lead.first_name,
             models.Lead.last_name,
@@ -213,8 +167,59 @@ def dashboard(db: Session = Depends(get_db), user=Depends(get_current_user)):
             models.Lead.source,
             models.Lead.created_at,
         )
-        .all()
+        .where(*lead_scope)
+        .order_by(models.Lead.created_at.desc())
+        .limit(5)
+    )
+
+    limit = asyncio.Semaphore(DASHBOARD_DB_CONCURRENCY)
+    (
+        (lead_stats,),
+        (act_stats,),
+        breakdown_rows,
+        recent_activities,
+        act_type_rows,
+        weekly_rows,
+        recent_leads,
+    ) = await asyncio.gather(
+        _fetch_all(limit, lead_stats_q),
+        _fetch_all(limit, act_stats_q),
+        _fetch_all(limit, breakdown_q),
+        _fetch_all(limit, recent_act_q),
+        _fetch_all(limit, act_type_q),
+        _fetch_all(limit, _TREND_8W_ADMIN if is_admin else _TREND_8W_USER, trend_params),
+        _fetch_all(limit, recent_leads_q),
     )
+
+    total_leads = lead_stats.total
+    new_leads_today = lead_stats.today
+    new_leads_7d = lead_stats.d7
+    new_leads_this_week = lead_stats.this_week
+    new_leads_30d = lead_stats.d30
+    won_30d = lead_stats.won_30d
+    lost_30d = lead_stats.lost_30d
+    closed_leads_this_month = lead_stats.closed_this_month
+    denom = won_30d + lost_30d
+    win_rate_30d = (won_30d / denom) if denom else 0.0
+
+    total_activities = act_stats.total
+    act_count_30d = act_stats.d30
+
+    leads_by_status = {}
+    leads_by_source = {}
+    for (by_source, st, src, c) in breakdown_rows:
+        if by_source:
+            # store None source as "unknown" for frontend convenience
+            leads_by_source[src or "unknown"] = c
+        else:
+            leads_by_status[st] = c
+    activities_by_type_30d = {t: c for (t, c) in act_type_rows}
+
+    # average activities per active lead (last 30 days window)
+    avg_activities_per_lead_30d = (act_count_30d / total_leads) if total_leads else 0.0
+
+    weeks_list = [{"week_start": wk.isoformat(), "count": c} for (wk, c) in weekly_rows]
+
     recent_leads_out = [
         {
             "id": lid,
@@ -226,7 +231,7 @@ def dashboard(db: Session = Depends(get_db), user=Depends(get_current_user)):
         for (lid, fn, ln, st, src, ca) in recent_leads
     ]
 
-    return {
+    payload = {
         # --- Backward compatible keys ---
         "total_leads": total_leads,
         "total_activities": int(total_activities or 0),
@@ -249,4 +254,7 @@ def dashboard(db: Session = Depends(get_db), user=Depends(get_current_user)):
         "avg_activities_per_lead_30d": avg_activities_per_lead_30d,
         "leads_trend_8w": weeks_list,
         "recent_leads": recent_leads_out,
-    }
\ No newline at end of file
+    }
+    response = ORJSONResponse(payload)
+    await cache.aset_dashboard(user.id, is_admin, response.body)
+    return response
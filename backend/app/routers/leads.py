@@ -1,106 +1,196 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import Optional
+from sqlalchemy import func, lambda_stmt, select, tuple_, update
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+from sqlalchemy.orm import Session, joinedload
+from datetime import datetime
+from typing import Optional, Tuple
+import base64
 import logging
+import re
 
 from ..database import get_db
-from .. import models
+from .. import cache, models
 from ..schemas import LeadCreate, LeadUpdate, LeadOut, LeadPagination
 from .users import get_current_user  # reuse auth dependency
-from fastapi.responses import StreamingResponse
-import io, csv
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
+import itertools
 
 
 logger = logging.getLogger(__name__)
 
 
-def _to_int(v: Optional[str]) -> Optional[int]:
-    """Convert a string query parameter to int; return None for blanks/non-digits."""
-    if v is None:
-        return None
-    s = str(v).strip()
-    return int(s) if s.isdigit() else None
-
-
-def _scoped_query(db: Session, user):
+def _scope_filters(user) -> tuple:
     """
-    Return a base query scoped by user permissions.
+    WHERE clauses scoping leads by user permissions.
     Admins see all active leads; regular users only see their own active leads.
     """
-    q = db.query(models.Lead).filter(models.Lead.is_active.is_(True))
-    if not getattr(user, "is_admin", False):
-        q = q.filter(models.Lead.user_id == user.id)
-    return q
+    if getattr(user, "is_admin", False):
+        return (models.Lead.is_active.is_(True),)
+    return (models.Lead.is_active.is_(True), models.Lead.user_id == user.id)
 
 
-def _display_name(u):
-    """Return best-effort full name for assigned_to/owner_name; fallback to email."""
-    first = (getattr(u, "first_name", None) or "").strip()
-    last = (getattr(u, "last_name", None) or "").strip()
-    full = f"{first} {last}".strip()
-    return full or getattr(u, "email", "")
+def _get_visible_lead(db: Session, user, lead_id: int, with_owner: bool = False):
+    """
+    Fetch a lead by primary key and apply the _scope_filters rules in Python.
+    db.get() answers from the session identity map when it can and otherwise issues a
+    plain PK lookup; `with_owner` loads Lead.owner in the same statement (LEFT OUTER
+    JOIN users) for callers that render owner_name. Returns None when not visible.
+    """
+    options = [joinedload(models.Lead.owner)] if with_owner else None
+    lead = db.get(models.Lead, lead_id, options=options)
+    if lead is None or not lead.is_active:
+        return None
+    if not getattr(user, "is_admin", False) and lead.user_id != user.id:
+        return None
+    return lead
 
 
 def _add_owner_name(lead: models.Lead):
     """Attach owner_name (not stored column) for response models."""
     if getattr(lead, "owner", None):
-        setattr(lead, "owner_name", _display_name(lead.owner))
+        setattr(lead, "owner_name", lead.owner.display_name)
     else:
         setattr(lead, "owner_name", None)
     return lead
 
 
-def _filter_leads_query(
-    query,
+def _filter_leads_stmt(
+    stmt: StatementLambdaElement,
+    user,
     q: Optional[str] = None,
     status_filter: Optional[str] = None,
     source: Optional[str] = None,
-    min_budget: Optional[str] = None,
-    max_budget: Optional[str] = None,
-):
+    min_budget: Optional[int] = None,
+    max_budget: Optional[int] = None,
+) -> StatementLambdaElement:
     """
-    Apply search and filter parameters to the leads query.
-    Raises HTTPException 400 for invalid filter inputs.
+    Add the permission scope (see _scope_filters) and the search/filter parameters to a
+    lambda statement over leads. Only plain values are closed over, so each filter
+    combination is built and compiled once and later requests just rebind parameters.
+    Budgets arrive already validated as non-negative ints by the Query declarations.
     """
-    if q:
-        like = f"%{q}%"
-        query = query.filter(
-            (models.Lead.first_name.ilike(like)) |
-            (models.Lead.last_name.ilike(like)) |
-            (models.Lead.email.ilike(like))
-        )
+    stmt += lambda s: s.where(models.Lead.is_active.is_(True))
+    if not getattr(user, "is_admin", False):
+        uid = user.id
+        stmt += lambda s: s.where(models.Lead.user_id == uid)
+
+    words = q.split() if q else []
+    if len(words) > 1 and all(_SEARCH_WORD_RE.fullmatch(w) for w in words):
+        # Whitespace-separated name words: full-text match on search_tsv (ix_leads_search_tsv),
+        # every word as a prefix so "jo smi" finds "John Smith". Words are \w-only, so the
+        # tsquery is safe.
+        tsquery = " & ".join(f"{w.lower()}:*" for w in words)
+        stmt += lambda s: s.where(models.Lead.search_tsv.op("@@")(func.to_tsquery("simple", tsquery)))
+    elif q:
+        # Single term, or anything with @ . - etc.: substring LIKE over the lower-cased
+        # name/email haystack, served by ix_leads_search_trgm (also matches inside emails,
+        # which FTS tokenizes whole).
+        # User-typed % and _ are escaped so they match literally rather than as wildcards.
+        term = q.lower().replace("/", "//").replace("%", "/%").replace("_", "/_")
+        pattern = f"%{term}%"
+        stmt += lambda s: s.where(models.lead_search_text.like(pattern, escape="/"))
 
     if status_filter:
-        query = query.filter(models.Lead.status == status_filter)
+        stmt += lambda s: s.where(models.Lead.status == status_filter)
 
     if source:
-        query = query.filter(models.Lead.source == source)
+        stmt += lambda s: s.where(models.Lead.source == source)
+
+    if min_budget is not None:
+        stmt += lambda s: s.where(models.Lead.budget_min >= min_budget)
+    if max_budget is not None:
+        stmt += lambda s: s.where(models.Lead.budget_max <= max_budget)
+
+    return stmt
+
+
+def _count_leads(db: Session, user, *filter_args) -> int:
+    """Plain Core count of the leads matching _filter_leads_stmt(user, *filter_args)."""
+    stmt = lambda_stmt(lambda: select(func.count()).select_from(models.Lead))
+    return db.execute(_filter_leads_stmt(stmt, user, *filter_args)).scalar_one()
+
+
+def _encode_cursor(created_at: datetime, lead_id: int) -> str:
+    """Opaque keyset cursor: urlsafe base64 of "<created_at iso>,<id>"."""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()},{lead_id}".encode()).decode()
 
-    mb = _to_int(min_budget)
-    xb = _to_int(max_budget)
-    if min_budget is not None and mb is None and min_budget.strip() != "":
-        logger.error(f"Invalid min_budget filter input: {min_budget}")
-        raise HTTPException(status_code=400, detail="Invalid filter input for min_budget")
-    if max_budget is not None and xb is None and max_budget.strip() != "":
-        logger.error(f"Invalid max_budget filter input: {max_budget}")
-        raise HTTPException(status_code=400, detail="Invalid filter input for max_budget")
 
-    if mb is not None:
-        query = query.filter(models.Lead.budget_min != None).filter(models.Lead.budget_min >= mb)
-    if xb is not None:
-        query = query.filter(models.Lead.budget_max != None).filter(models.Lead.budget_max <= xb)
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of _encode_cursor. Raises HTTPException 400 for malformed cursors."""
+    try:
+        at, lead_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit(",", 1)
+        return datetime.fromisoformat(at), int(lead_id)
+    except ValueError:
+        logger.debug(f"Invalid pagination cursor: {cursor}")
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    return query
+
+def _lead_out_from_row(row) -> LeadOut:
+    """
+    Build LeadOut from a (*_LEAD_OUT_COLUMNS, owner display_name) row.
+    Values come straight from typed columns, so model_construct skips re-validation.
+    """
+    *lead, owner_name = row
+    return LeadOut.model_construct(**dict(zip(_LEAD_OUT_FIELDS, lead)), owner_name=owner_name)
 
 
 router = APIRouter(prefix="/leads", tags=["leads"])
 
+# A `q` word eligible for the full-text branch: letters/digits only. Emails and
+# dotted terms (jane@example.com, jane.doe) are single 'simple' tokens that a
+# per-word prefix tsquery would never match, so they stay on the LIKE path.
+_SEARCH_WORD_RE = re.compile(r"\w+")
+
+# Columns backing LeadOut (owner_name is joined in separately)
+_LEAD_OUT_COLUMNS = (
+    models.Lead.id,
+    models.Lead.first_name,
+    models.Lead.last_name,
+    models.Lead.email,
+    models.Lead.phone,
+    models.Lead.status,
+    models.Lead.source,
+    models.Lead.budget_min,
+    models.Lead.budget_max,
+    models.Lead.property_interest,
+    models.Lead.location,
+    models.Lead.assigned_to,
+    models.Lead.notes,
+    models.Lead.user_id,
+    models.Lead.is_active,
+    models.Lead.created_at,
+    models.Lead.updated_at,
+)
+_LEAD_OUT_FIELDS = tuple(c.key for c in _LEAD_OUT_COLUMNS)
+
+# CSV export columns
+_EXPORT_COLUMNS = (
+    models.Lead.id,
+    models.Lead.first_name,
+    models.Lead.last_name,
+    models.Lead.email,
+    models.Lead.phone,
+    models.Lead.status,
+    models.Lead.source,
+    models.Lead.budget_min,
+    models.Lead.budget_max,
+    models.Lead.property_interest,
+    models.Lead.created_at,
+    models.Lead.updated_at,
+    models.User.display_name.label("owner_name"),
+)
+_PAGE_ADAPTER = TypeAdapter(LeadPagination)
+
+# CSV export streaming: bytes buffered per chunk sent
+_CSV_CHUNK_BYTES = 64 * 1024
+
 # -------- Create --------
 @router.post("", response_model=LeadOut, status_code=201)
 def create_lead(payload: LeadCreate, db: Session = Depends(get_db), user=Depends(get_current_user)):
     data = payload.dict()
     if not data.get("assigned_to"):
-        data["assigned_to"] = _display_name(user)
+        data["assigned_to"] = user.display_name
 
     lead = models.Lead(**data, user_id=user.id)
     try:
@@ -108,6 +198,7 @@ def create_lead(payload: LeadCreate, db: Session = Depends(get_db), user=Depends
         db.commit()
         db.refresh(lead)
         logger.info(f"Lead created with id={lead.id} by user_id={user.id}")
+        cache.invalidate_dashboard(user.id)
     except Exception as e:
         logger.error(f"Error creating lead: {e}", exc_info=True)
         db.rollback()
@@ -121,38 +212,71 @@ def list_leads(
     q: Optional[str] = Query(None, description="search in name/email"),
     status_filter: Optional[str] = Query(None, alias="status"),
     source: Optional[str] = Query(None, description="filter by source"),
-    min_budget: Optional[str] = Query(None, description="filter by minimum budget (string, blank allowed)"),
-    max_budget: Optional[str] = Query(None, description="filter by maximum budget (string, blank allowed)"),
+    min_budget: Optional[int] = Query(None, ge=0, description="filter by minimum budget"),
+    max_budget: Optional[int] = Query(None, ge=0, description="filter by maximum budget"),
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100, alias="page_size"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (keyset pagination; page is ignored)"),
     db: Session = Depends(get_db),
     user=Depends(get_current_user),
 ):
+    filter_args = (q, status_filter, source, min_budget, max_budget)
+    limit = page_size + 1
     try:
-        query = _scoped_query(db, user)
-        query = _filter_leads_query(query, q, status_filter, source, min_budget, max_budget)
-
-        total = query.count()
-        items = (
-            query.order_by(models.Lead.created_at.desc())
-                 .offset((page - 1) * page_size)
-                 .limit(page_size)
-                 .all()
+        # Only the LeadOut columns, owner display name via LEFT JOIN: no ORM instances.
+        stmt = _filter_leads_stmt(
+            lambda_stmt(
+                lambda: select(*_LEAD_OUT_COLUMNS, models.User.display_name)
+                .outerjoin(models.User, models.User.id == models.Lead.user_id)
+            ),
+            user,
+            *filter_args,
         )
+        if cursor is not None:
+            # Keyset: seek past the last row of the previous page instead of OFFSET-scanning
+            # every earlier row. The window count would only cover the remaining rows here,
+            # so the total is counted separately.
+            c_at, c_id = _decode_cursor(cursor)
+            stmt += lambda s: s.where(tuple_(models.Lead.created_at, models.Lead.id) < tuple_(c_at, c_id))
+        else:
+            # count(*) OVER () returns the filtered total alongside the page in the same scan
+            offset = (page - 1) * page_size
+            stmt += lambda s: s.add_columns(func.count().over().label("total_count")).offset(offset)
+        # One extra row is fetched to know whether a next page (next_cursor) exists
+        stmt += lambda s: s.order_by(models.Lead.created_at.desc(), models.Lead.id.desc()).limit(limit)
+        rows = db.execute(stmt).all()
+
+        if cursor is not None:
+            total = _count_leads(db, user, *filter_args)
+        else:
+            if rows:
+                total = rows[0].total_count
+            elif page == 1:
+                total = 0
+            else:
+                # Past the last page no row carries the window count; fall back to a plain count
+                total = _count_leads(db, user, *filter_args)
+            rows = [row[:-1] for row in rows]
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error listing leads: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to list leads")
 
-    items = [_add_owner_name(l) for l in items]
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = dict(zip(_LEAD_OUT_FIELDS, rows[-1]))
+        next_cursor = _encode_cursor(last["created_at"], last["id"])
 
-    return {
-        "items": items,
-        "total": total,
-        "page": page,
-        "size": page_size,
-    }
+    items = [_lead_out_from_row(row) for row in rows]
+
+    # Items are already LeadOut instances: serialize the page in one pydantic-core pass
+    # instead of letting FastAPI re-validate it against response_model
+    page_out = LeadPagination.model_construct(
+        items=items, total=total, page=page, size=page_size, next_cursor=next_cursor
+    )
+    return Response(content=_PAGE_ADAPTER.dump_json(page_out), media_type="application/json")
 
 # -------- Export CSV (respects same filters) --------
 @router.get("/export")
@@ -161,59 +285,60 @@ def export_leads_csv(
     q: Optional[str] = Query(None, description="search in name/email"),
     status_filter: Optional[str] = Query(None, alias="status"),
     source: Optional[str] = Query(None, description="filter by source"),
-    min_budget: Optional[str] = Query(None, description="filter by minimum budget (string, blank allowed)"),
-    max_budget: Optional[str] = Query(None, description="filter by maximum budget (string, blank allowed)"),
+    min_budget: Optional[int] = Query(None, ge=0, description="filter by minimum budget"),
+    max_budget: Optional[int] = Query(None, ge=0, description="filter by maximum budget"),
     db: Session = Depends(get_db),
     user=Depends(get_current_user),
 ):
+    stmt = _filter_leads_stmt(
+        lambda_stmt(
+            lambda: select(*_EXPORT_COLUMNS).outerjoin(models.User, models.User.id == models.Lead.user_id)
+        ),
+        user,
+        q, status_filter, source, min_budget, max_budget,
+    )
+    stmt += lambda s: s.order_by(models.Lead.created_at.desc())
+    # render_postcompile inlines literal_execute params (e.g. the search haystack constants)
+    compiled = stmt.compile(dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+
+    def generate():
+        # Postgres formats the CSV (header included); Python only relays the bytes
+        raw = db.connection().connection.driver_connection
+        sent = 0
+        buf = bytearray()
+        with raw.cursor() as cur:
+            with cur.copy(f"COPY ({compiled}) TO STDOUT WITH (FORMAT csv, HEADER)", compiled.params) as copy:
+                for block in copy:
+                    buf += block
+                    if len(buf) >= _CSV_CHUNK_BYTES:
+                        sent += len(buf)
+                        yield bytes(buf)
+                        buf.clear()
+        sent += len(buf)
+        yield bytes(buf)
+        logger.info(f"Leads CSV exported by user_id={user.id}, bytes={sent}")
+
+    chunks = generate()
     try:
-        query = _scoped_query(db, user)
-        query = _filter_leads_query(query, q, status_filter, source, min_budget, max_budget)
-
-        rows = (
-            query.order_by(models.Lead.created_at.desc())
-                 .all()
-        )
-    except HTTPException:
-        raise
+        # Start the COPY now so DB errors still surface as a 500 rather than a truncated body
+        first = next(chunks)
     except Exception as e:
         logger.error(f"Error exporting leads CSV: {e}", exc_info=True)
+        db.rollback()
         raise HTTPException(status_code=500, detail="Failed to export leads")
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "id", "first_name", "last_name", "email", "phone", "status", "source",
-        "budget_min", "budget_max", "property_interest", "created_at", "updated_at", "owner_name"
-    ])
-
-    for l in rows:
-        writer.writerow([
-            l.id,
-            l.first_name or "",
-            l.last_name or "",
-            l.email or "",
-            l.phone or "",
-            l.status or "",
-            l.source or "",
-            l.budget_min if l.budget_min is not None else "",
-            l.budget_max if l.budget_max is not None else "",
-            l.property_interest or "",
-            getattr(l, "created_at", "") or "",
-            getattr(l, "updated_at", "") or "",
-            _display_name(l.owner) if getattr(l, "owner", None) else ""
-        ])
-
-    output.seek(0)
-    headers = {"Content-Disposition": "attachment; filename=leads.csv"}
-    logger.info(f"Leads CSV exported by user_id={user.id}, rows={len(rows)}")
-    return StreamingResponse(iter([output.getvalue()]), media_type="text/csv", headers=headers)
+    headers = {
+        "Content-Disposition": "attachment; filename=leads.csv",
+        # The frontend nginx proxies /api/ with buffering on; let chunks through as they come
+        "X-Accel-Buffering": "no",
+    }
+    return StreamingResponse(itertools.chain((first,), chunks), media_type="text/csv", headers=headers)
 
 # -------- Get by id --------
 @router.get("/{lead_id}", response_model=LeadOut)
 def get_lead(lead_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
     try:
-        lead = _scoped_query(db, user).filter(models.Lead.id == lead_id).first()
+        lead = _get_visible_lead(db, user, lead_id, with_owner=True)
     except Exception as e:
         logger.error(f"Error fetching lead id={lead_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch lead")
@@ -225,17 +350,29 @@ def get_lead(lead_id: int, db: Session = Depends(get_db), user=Depends(get_curre
 # -------- Update --------
 @router.put("/{lead_id}", response_model=LeadOut)
 def update_lead(lead_id: int, payload: LeadUpdate, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    data = payload.dict(exclude_unset=True)
     try:
-        lead = _scoped_query(db, user).filter(models.Lead.id == lead_id).first()
+        if data:
+            # Single UPDATE ... RETURNING instead of SELECT, mutate, flush and refresh
+            lead = db.scalars(
+                update(models.Lead)
+                .where(models.Lead.id == lead_id, *_scope_filters(user))
+                .values(**data)
+                .returning(models.Lead)
+                .execution_options(synchronize_session=False)
+            ).one_or_none()
+        else:
+            lead = _get_visible_lead(db, user, lead_id)
         if not lead:
             raise HTTPException(status_code=404, detail="Lead not found")
 
-        for k, v in payload.dict(exclude_unset=True).items():
-            setattr(lead, k, v)
-
+        # The requester usually owns the lead; reuse it instead of lazy-loading the owner
+        setattr(lead, "owner_name", (user if lead.user_id == user.id else lead.owner).display_name)
+        # Detach so commit() does not expire the RETURNING values (no refresh SELECT)
+        db.expunge(lead)
         db.commit()
-        db.refresh(lead)
         logger.info(f"Lead updated with id={lead_id} by user_id={user.id}")
+        cache.invalidate_dashboard(lead.user_id)
     except HTTPException:
         raise
     except Exception as e:
@@ -243,22 +380,28 @@ def update_lead(lead_id: int, payload: LeadUpdate, db: Session = Depends(get_db)
         db.rollback()
         raise HTTPException(status_code=500, detail="Failed to update lead")
 
-    return _add_owner_name(lead)
+    return lead
 
 # -------- Soft delete --------
 @router.delete("/{lead_id}", status_code=204)
 def delete_lead(lead_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
     try:
-        lead = _scoped_query(db, user).filter(models.Lead.id == lead_id).first()
-        if not lead:
+        # One UPDATE ... RETURNING; no SELECT or ORM instance just to flip is_active
+        owner_id = db.execute(
+            update(models.Lead)
+            .where(models.Lead.id == lead_id, *_scope_filters(user))
+            .values(is_active=False)
+            .returning(models.Lead.user_id)
+        ).scalar_one_or_none()
+        if owner_id is None:
             raise HTTPException(status_code=404, detail="Lead not found")
-        lead.is_active = False
         db.commit()
         logger.info(f"Lead soft deleted with id={lead_id} by user_id={user.id}")
+        cache.invalidate_dashboard(owner_id)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error deleting lead id={lead_id}: {e}", exc_info=True)
         db.rollback()
         raise HTTPException(status_code=500, detail="Failed to delete lead")
-    return
\ No newline at end of file
+    return
@@ -1,19 +1,39 @@
+import os
+from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import AsyncSessionLocal, get_async_db
 from .. import models
 from ..schemas import UserCreate, UserOut, Token
-from ..auth import hash_password, verify_password, create_access_token, decode_token, ACCESS_MIN
+from ..auth import ahash_password, averify_password, password_needs_rehash, create_access_token, decode_token, ACCESS_MIN
 
 router = APIRouter(prefix="/users", tags=["users"])
 oauth2 = OAuth2PasswordBearer(tokenUrl="/users/login")
 
+# Built once so every login reuses the same compiled statement
+_stmt_user_by_email = select(models.User).where(models.User.email == bindparam("e"))
+
+# Short-lived cache of authenticated users keyed by id. Together with the verified
+# token cache in auth.decode_token, a repeat request authenticates without touching
+# the DB. Profile/role changes become visible after at most USER_CACHE_TTL seconds.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "5000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "30"))
+_user_cache: TTLCache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
 # -------- Register --------
 @router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user account."""
-    existing = db.query(models.User).filter(models.User.email == user.email).first()
+    # Stored lower-cased so login's `email = :e` lookup matches without lower(email)
+    email = user.email.strip().lower()
+    # lower(email) (served by ux_users_email_lower) also catches rows stored mixed-case
+    # before emails were normalized
+    existing = (
+        await db.execute(select(models.User.id).where(func.lower(models.User.email) == email).limit(1))
+    ).first()
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -21,38 +41,53 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         )
 
     db_user = models.User(
-        email=user.email,
-        password_hash=hash_password(user.password),
+        email=email,
+        password_hash=await ahash_password(user.password),
         first_name=user.first_name.strip() if user.first_name else None,
         last_name=user.last_name.strip() if user.last_name else None,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent registration of the same email
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered. Please log in instead."
+        )
+    await db.refresh(db_user)
     return db_user
 
 
 # -------- Login --------
 @router.post("/login", response_model=Token)
-def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     Authenticate user and return JWT access token.
     Note: OAuth2PasswordRequestForm expects 'username' instead of 'email'.
     """
-    user = db.query(models.User).filter(models.User.email == form.username.strip().lower()).first()
-    if not user or not verify_password(form.password, user.password_hash):
+    user = (
+        await db.execute(_stmt_user_by_email, {"e": form.username.strip().lower()})
+    ).scalar_one_or_none()
+    if not user or not await averify_password(form.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password.",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Opportunistically upgrade hashes created with older Argon2 parameters
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = await ahash_password(form.password)
+        await db.commit()
+
     token = create_access_token(sub=user.id, is_admin=user.is_admin)
     return {"access_token": token, "token_type": "bearer", "expires_in_minutes": ACCESS_MIN}
 
 
 # -------- Current user --------
-def get_current_user(token: str = Depends(oauth2), db: Session = Depends(get_db)) -> models.User:
+async def get_current_user(token: str = Depends(oauth2)) -> models.User:
     """Decode and return the current user from the access token."""
     try:
         payload = decode_token(token)
@@ -68,9 +103,20 @@ def get_current_user(token: str = Depends(oauth2), db: Session = Depends(get_db)
             detail="Invalid or expired token. Please log in again."
         )
 
-    user = db.get(models.User, uid)
+    user = _user_cache.get(uid)
+    if user is not None:
+        return user
+
+    # Short-lived session instead of a get_async_db dependency: the connection goes back
+    # to the pool before the handler runs rather than after the response is sent
+    async with AsyncSessionLocal() as db:
+        user = await db.get(models.User, uid)
+        if user is not None:
+            # Detach so the cached instance is never tied to (or flushed by) a later session
+            db.expunge(user)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
+    _user_cache[uid] = user
     return user
 
 
@@ -89,6 +89,8 @@ class LeadPagination(BaseModel):
     page: int
     size: int
     items: List[LeadOut]
+    # Pass back as ?cursor= for the next page (keyset pagination); None on the last page
+    next_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
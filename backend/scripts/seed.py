@@ -3,7 +3,7 @@ import random
 from datetime import datetime, timedelta, timezone
 
 from dotenv import load_dotenv
-from sqlalchemy import inspect
+from sqlalchemy import exists, func, insert, inspect, select
 from sqlalchemy.orm import Session
 
 load_dotenv()  # read backend/.env
@@ -26,6 +26,7 @@ except Exception:
 # Helper to create or fetch a user, optionally as admin
 def ensure_user(session: Session, email: str, password: str, first_name: str, last_name: str, *, make_admin: bool = False) -> models.User:
     """Create (or fetch) a user by email. Optionally toggle admin flag. Idempotent."""
+    email = email.strip().lower()  # stored lower-cased, as by the register endpoint
     user = session.query(models.User).filter_by(email=email).first()
     if user:
         # ensure admin flag matches request when asked to make_admin
@@ -53,7 +54,7 @@ def ensure_admin(session: Session) -> models.User | None:
     if admin:
         return admin
 
-    admin_email = os.getenv("ADMIN_EMAIL")
+    admin_email = (os.getenv("ADMIN_EMAIL") or "").strip().lower()
     admin_password = os.getenv("ADMIN_PASSWORD")
     if not admin_email or not admin_password:
         print("❌ No admin user found and ADMIN_EMAIL/ADMIN_PASSWORD not provided. Skipping seed.")
@@ -81,6 +82,86 @@ def ensure_admin(session: Session) -> models.User | None:
     return user
 
 
+# Sample value pools
+FIRST_NAMES = ["John", "Jane", "Alice", "Bob", "Eve", "Tom", "Sarah", "David", "Liam", "Sophia"]
+LAST_NAMES = ["Smith", "Johnson", "Brown", "Williams", "Miller"]
+STATUSES = ["new", "contacted", "qualified", "won", "lost"]
+SOURCES = ["Website", "Referral", "LinkedIn", "Advertisement", "Cold Call"]
+PROPERTY_TYPES = ["Apartment", "Villa", "Plot", "Office", "Shop"]
+ACT_TYPES = ["call", "email", "meeting", "note"]
+ACT_TITLES = ["Initial Contact", "Follow-up", "Negotiation", "Site Visit"]
+
+
+def sample_lead_rows(owner_id: int, emails: list[str], phone_prefix: str) -> list[dict]:
+    """Random lead rows for `emails`; each field is drawn for all rows in one random.choices call."""
+    k = len(emails)
+    return [
+        dict(
+            first_name=first,
+            last_name=last,
+            email=email,
+            phone=f"{phone_prefix}{phone}",
+            status=status,
+            source=source,
+            property_interest=prop,  # string field
+            budget_min=bmin,
+            budget_max=bmax,
+            user_id=owner_id,
+        )
+        for email, first, last, phone, status, source, prop, bmin, bmax in zip(
+            emails,
+            random.choices(FIRST_NAMES, k=k),
+            random.choices(LAST_NAMES, k=k),
+            random.choices(range(10000, 100000), k=k),
+            random.choices(STATUSES, k=k),
+            random.choices(SOURCES, k=k),
+            random.choices(PROPERTY_TYPES, k=k),
+            random.choices(range(30000, 50001), k=k),
+            random.choices(range(60000, 100001), k=k),
+        )
+    ]
+
+
+def sample_activity_rows(lead_ids: list[int], user_id: int) -> list[dict]:
+    """1-3 random activities per lead, with all random values drawn up front."""
+    per_lead = random.choices(range(1, 4), k=len(lead_ids))
+    row_lead_ids = [lead_id for lead_id, n in zip(lead_ids, per_lead) for _ in range(n)]
+    k = len(row_lead_ids)
+    now = datetime.now(timezone.utc)
+    return [
+        dict(
+            lead_id=lead_id,
+            user_id=user_id,
+            activity_type=act_type,
+            title=title,
+            notes="Auto-generated sample activity",
+            duration=duration,
+            activity_date=now - timedelta(days=days_ago),
+        )
+        for lead_id, act_type, title, duration, days_ago in zip(
+            row_lead_ids,
+            random.choices(ACT_TYPES, k=k),
+            random.choices(ACT_TITLES, k=k),
+            random.choices(range(5, 31), k=k),
+            random.choices(range(0, 15), k=k),
+        )
+    ]
+
+
+def insert_missing_leads(session: Session, rows: list[dict]) -> int:
+    """
+    Insert the lead rows whose email is not in the DB yet (idempotent by email).
+    One SELECT ... IN for the existing emails and one executemany INSERT, instead of
+    a lookup and an add per lead.
+    """
+    emails = [r["email"] for r in rows]
+    existing = set(session.scalars(select(models.Lead.email).where(models.Lead.email.in_(emails))))
+    new_rows = [r for r in rows if r["email"] not in existing]
+    if new_rows:
+        session.execute(insert(models.Lead), new_rows)
+    return len(new_rows)
+
+
 def seed():
     # Ensure schema exists (do not create here; avoid races)
     inspector = inspect(engine)
@@ -104,31 +185,9 @@ def seed():
 
 
         # 2) Create sample leads (idempotent by unique email)
-        first_names = ["John", "Jane", "Alice", "Bob", "Eve", "Tom", "Sarah", "David", "Liam", "Sophia"]
-        statuses = ["new", "contacted", "qualified", "won", "lost"]
-        sources = ["Website", "Referral", "LinkedIn", "Advertisement", "Cold Call"]
-        property_types = ["Apartment", "Villa", "Plot", "Office", "Shop"]
-
-        new_leads = 0
-        for i in range(10):
-            email = f"lead{i+1}@example.com"
-            existing = session.query(models.Lead).filter_by(email=email).first()
-            if existing:
-                continue
-            lead = models.Lead(
-                first_name=random.choice(first_names),
-                last_name=random.choice(["Smith", "Johnson", "Brown", "Williams", "Miller"]),
-                email=email,
-                phone=f"99999{random.randint(10000, 99999)}",
-                status=random.choice(statuses),
-                source=random.choice(sources),
-                property_interest=random.choice(property_types),  # string field
-                budget_min=random.randint(30000, 50000),
-                budget_max=random.randint(60000, 100000),
-                user_id=admin.id,
-            )
-            session.add(lead)
-            new_leads += 1
+        new_leads = insert_missing_leads(
+            session, sample_lead_rows(admin.id, [f"lead{i+1}@example.com" for i in range(10)], "99999")
+        )
         session.commit()
         print(f"✅ Sample leads added: {new_leads}")
 
@@ -144,26 +203,8 @@ def seed():
         u2_last = os.getenv("USER2_LAST_NAME", "Member")
 
         def seed_leads_for(owner: models.User, count: int, email_prefix: str) -> int:
-            added = 0
-            for i in range(count):
-                lead_email = f"{email_prefix}.lead{i+1}@example.com"
-                exists = session.query(models.Lead).filter_by(email=lead_email).first()
-                if exists:
-                    continue
-                lead = models.Lead(
-                    first_name=random.choice(first_names),
-                    last_name=random.choice(["Smith", "Johnson", "Brown", "Williams", "Miller"]),
-                    email=lead_email,
-                    phone=f"88888{random.randint(10000, 99999)}",
-                    status=random.choice(statuses),
-                    source=random.choice(sources),
-                    property_interest=random.choice(property_types),
-                    budget_min=random.randint(30000, 50000),
-                    budget_max=random.randint(60000, 100000),
-                    user_id=owner.id,
-                )
-                session.add(lead)
-                added += 1
+            emails = [f"{email_prefix}.lead{i+1}@example.com" for i in range(count)]
+            added = insert_missing_leads(session, sample_lead_rows(owner.id, emails, "88888"))
             session.commit()
             return added
 
@@ -186,29 +227,18 @@ def seed():
             print("ℹ️ USER2_EMAIL/USER2_PASSWORD not set. Skipping user2 seed.")
 
         # 3) Create sample activities per lead (bounded/idempotent-enough)
-        leads = session.query(models.Lead).all()
-        act_types = ["call", "email", "meeting", "note"]
-        new_acts = 0
-        for lead in leads:
-            # If the lead already has any activity, skip to keep idempotence
-            already = session.query(models.Activity).filter(models.Activity.lead_id == lead.id).first()
-            to_create = 0 if already else random.randint(1, 3)
-            for _ in range(to_create):
-                act = models.Activity(
-                    lead_id=lead.id,
-                    user_id=admin.id,
-                    activity_type=random.choice(act_types),
-                    title=random.choice(["Initial Contact", "Follow-up", "Negotiation", "Site Visit"]),
-                    notes="Auto-generated sample activity",
-                    duration=random.randint(5, 30),
-                    activity_date=datetime.now(timezone.utc) - timedelta(days=random.randint(0, 14)),
-                )
-                session.add(act)
-                new_acts += 1
+        # Only leads without any activity get some, to keep idempotence (one anti-join query)
+        lead_ids = session.scalars(
+            select(models.Lead.id).where(~exists().where(models.Activity.lead_id == models.Lead.id))
+        ).all()
+        act_rows = sample_activity_rows(lead_ids, admin.id)
+        if act_rows:
+            session.execute(insert(models.Activity), act_rows)
         session.commit()
+        new_acts = len(act_rows)
         print(f"✅ Sample activities added: {new_acts}")
-        total_leads = session.query(models.Lead).count()
-        total_users = session.query(models.User).count()
+        total_leads = session.scalar(select(func.count()).select_from(models.Lead))
+        total_users = session.scalar(select(func.count()).select_from(models.User))
         print(f"🎯 Seeding complete. Users: {total_users}, Leads: {total_leads}, Activities added this run: {new_acts}")
 
     finally: